@@ -8,10 +8,36 @@ VR 電流急急棒遊戲邏輯 - 完整版（答案）
 3. 追蹤遊戲狀態（計時、碰撞次數）
 """
 
+import logging
 import math
+import threading
 import time
 from typing import List, Tuple, Dict, Optional
 
+import numpy as np
+
+logger = logging.getLogger("buzzwire")
+
+# NumPy 路徑的暫存緩衝區最多容納幾個偵測點
+# （兩隻手把 + 餘裕；超過就退回每幀配置）
+MAX_POINTS = 4
+
+# 編譯核心（可選），依序嘗試：
+# 1. Cython AOT 擴充模組（setup.py build_ext --inplace）——
+#    匯入即機器碼，沒有 JIT 暖機延遲
+# 2. Numba JIT 核心（_kernels.py）
+# 3. 都沒有就退回純 NumPy 路徑
+try:
+    from _distance import min_dist2 as _min_dist2_kernel
+    _KERNEL_NEEDS_WARMUP = False
+except ImportError:
+    try:
+        from _kernels import min_dist2 as _min_dist2_kernel
+        _KERNEL_NEEDS_WARMUP = True
+    except ImportError:
+        _min_dist2_kernel = None
+        _KERNEL_NEEDS_WARMUP = False
+
 
 class BuzzWireGame:
     """電流急急棒遊戲邏輯類別"""
@@ -25,15 +51,26 @@ class BuzzWireGame:
                                 手把與軌道距離小於此值視為碰撞
         """
         self.collision_threshold = collision_threshold
-        
+        # 閾值平方：熱路徑全程用距離平方比較，省掉每段的 sqrt
+        self._thr2 = collision_threshold ** 2
+
+        # 狀態鎖：多執行緒伺服器（gunicorn threads、測試客戶端）下
+        # 保護 is_colliding / collision_count 等欄位的讀改寫；
+        # 單一 asyncio 事件圈下鎖不會有競爭，成本約 100 ns
+        self._lock = threading.Lock()
+
         # 軌道定義：一系列 3D 點 [x, y, z]
         # 軌道從起點到終點，玩家要控制鐵環沿著軌道移動
         self.track_points = self._define_track()
-        
+
+        # 建立連續記憶體的線段陣列（熱路徑只讀這些，不碰 Python list）
+        self._build_segment_arrays()
+
         # 起點和終點區域（用於判定遊戲開始/結束）
         self.start_zone = self.track_points[0]
         self.end_zone = self.track_points[-1]
         self.zone_radius = 0.1  # 起點/終點區域半徑
+        self._zone_r2 = self.zone_radius ** 2  # 半徑平方，區域判定免開根號
         
         # 遊戲狀態
         self.reset()
@@ -81,7 +118,66 @@ class BuzzWireGame:
         ]
         
         return track
-    
+
+    def _build_segment_arrays(self):
+        """
+        把軌道轉成連續記憶體的 NumPy 線段陣列
+
+        `track_points` 維持巢狀 Python list（對外 JSON 用，例如 get_track()），
+        但 list-of-lists 的每個元素都是散落在 heap 上的 boxed float，
+        熱路徑逐段存取會不斷追指標、打亂快取。
+        這裡一次轉成 C-contiguous float32 陣列，之後每個 frame
+        只做連續記憶體的串流讀取。
+
+        全程使用 float32：座標是 VR 尺度（公尺、公分級精度），
+        float32 的 ~7 位有效數字遠超過 5 cm 閾值所需的 0.001 m，
+        而頻寬減半、SIMD 每個暫存器可以多塞一倍的 lane：
+        - _A：每條線段的起點 (N,3)
+        - _V：線段向量 (N,3)
+        - _invvv：線段長度平方的倒數 (N,)（乘法取代除法）
+
+        軌道是靜態的，只需要建一次；若 track_points 被重新指定，
+        必須重新呼叫本方法
+        """
+        self._A = np.ascontiguousarray(self.track_points[:-1], dtype=np.float32)
+        self._B = np.ascontiguousarray(self.track_points[1:], dtype=np.float32)
+        self._V = np.ascontiguousarray(self._B - self._A)
+        self._vv = np.maximum(np.einsum('ij,ij->i', self._V, self._V), 1e-10)
+        self._invvv = np.ascontiguousarray(1.0 / self._vv)
+
+        # 每條線段的 AABB（軸對齊包圍盒）：
+        # 到包圍盒的距離是到線段距離的下界，
+        # 核心可以用它先剔除明顯太遠的線段，跳過完整的投影計算
+        self._seg_min = np.ascontiguousarray(np.minimum(self._A, self._B))
+        self._seg_max = np.ascontiguousarray(np.maximum(self._A, self._B))
+
+        # NumPy 路徑的暫存緩衝區：每個執行緒各自配置一組、每幀重用，
+        # 避免 90 Hz 下每幀生出一批小陣列觸發 GC。
+        # thread-local 是因為距離計算在鎖外執行（見 update()）——
+        # 共用一組緩衝區會讓併發請求互相覆寫彼此的中間結果
+        self._scratch = threading.local()
+
+        # Numba 核心要先用假資料呼叫一次，
+        # 把 JIT 編譯（~1 秒）提前到啟動時，避免第一個 /update 卡住
+        # （Cython 核心是 AOT 編譯，不需要暖機）
+        if _KERNEL_NEEDS_WARMUP and _min_dist2_kernel is not None:
+            _min_dist2_kernel(np.zeros((1, 3), dtype=np.float32),
+                              self._A, self._V, self._invvv,
+                              self._seg_min, self._seg_max)
+
+    def set_threshold(self, collision_threshold: float):
+        """
+        更新碰撞判定閾值
+
+        只更新閾值和它的平方，不重建軌道與線段陣列，
+        讓伺服器可以重複使用同一個遊戲實例
+
+        Args:
+            collision_threshold: 新的碰撞判定閾值（單位：公尺）
+        """
+        self.collision_threshold = collision_threshold
+        self._thr2 = collision_threshold ** 2
+
     def reset(self):
         """重置遊戲狀態"""
         self.game_started = False
@@ -93,6 +189,19 @@ class BuzzWireGame:
         self.is_colliding: bool = False
         self.last_collision_time: float = 0.0
         self.cooldown: float = 0.5  # 碰撞冷卻時間（秒），避免重複計數
+
+        # 狀態回報 dict：配置一次、之後每幀就地更新欄位，
+        # 省掉每幀重建 8 個 key 的 dict（單一 worker 內安全）
+        self._state = {
+            "game_started": False,
+            "game_completed": False,
+            "timing_started": False,  # 新增
+            "elapsed_time": 0.0,
+            "collision_count": 0,
+            "is_colliding": False,
+            "distance_to_track": -1,
+            "collision_threshold": self.collision_threshold
+        }
     
     def start_game(self):
         """開始遊戲（進入準備狀態，等待玩家碰觸起點）"""
@@ -123,151 +232,148 @@ class BuzzWireGame:
         Returns:
             Dict: 包含遊戲狀態的字典
         """
-        if not self.game_started or self.game_completed:
-            return self.get_state()
-        
         # 標準化輸入：確保 positions 是點的列表
         if len(positions) > 0 and not isinstance(positions[0], list):
             # 單點格式 [x, y, z] -> [[x, y, z]]
             positions = [positions]
-        
+
         # 用第一個點來判斷區域（起點/終點）
         first_point = positions[0] if positions else [0, 0, 0]
-        
-        # 檢查是否碰到起點區域（開始計時）
-        if not self.timing_started:
-            if self._is_in_zone(first_point, self.start_zone):
-                self.timing_started = True
-                self.start_time = time.time()
-                print("[Game] Player touched start zone! Timer started.")
-            # 還沒碰到起點，不計算碰撞，直接返回
-            return self.get_state()
-        
-        # 更新經過時間
-        if self.start_time:
-            self.elapsed_time = time.time() - self.start_time
-        
-        # 多點碰撞偵測：計算所有點到軌道的最短距離，取最小值
-        min_distance = float('inf')
-        for point in positions:
-            dist = self._calculate_min_distance_to_track(point)
-            min_distance = min(min_distance, dist)
-        
-        # 碰撞偵測
-        current_time = time.time()
-        was_colliding = self.is_colliding
-        self.is_colliding = min_distance < self.collision_threshold
-        
-        # 新的碰撞事件（有冷卻時間）
-        if self.is_colliding and not was_colliding:
-            if current_time - self.last_collision_time > self.cooldown:
-                self.collision_count += 1
-                self.last_collision_time = current_time
-        
-        # 檢查是否到達終點（用第一個點判斷）
-        if self._is_in_zone(first_point, self.end_zone):
-            self.game_completed = True
-            print(f"[Game] Player reached end zone! Final time: {self.elapsed_time:.2f}s, Collisions: {self.collision_count}")
-        
-        return self.get_state(min_distance)
-    
-    def _calculate_min_distance_to_track(self, point: List[float]) -> float:
-        """
-        計算點到軌道的最短距離
-        
-        軌道由多條線段組成，計算點到每條線段的距離，取最小值
-        
-        Args:
-            point: 3D 點座標 [x, y, z]
-        
-        Returns:
-            float: 最短距離
-        """
-        min_distance = float('inf')
-        
-        # 遍歷所有線段
-        for i in range(len(self.track_points) - 1):
-            segment_start = self.track_points[i]
-            segment_end = self.track_points[i + 1]
-            
-            distance = self._point_to_segment_distance(point, segment_start, segment_end)
-            min_distance = min(min_distance, distance)
-        
-        return min_distance
-    
-    def _point_to_segment_distance(self, point: List[float], 
-                                    seg_start: List[float], 
-                                    seg_end: List[float]) -> float:
+
+        # 多點碰撞偵測：所有點 × 所有線段一次廣播計算，取全域最小值
+        # 全程使用距離平方，只有回報狀態時才開根號
+        # （純讀靜態陣列，不必持鎖）
+        min_d2 = self._min_dist2_to_track(positions)
+
+        # 狀態的讀改寫全部在鎖內完成，
+        # 並在鎖內組好回覆，避免併發請求互相踩到一半的狀態
+        with self._lock:
+            if not self.game_started or self.game_completed:
+                return self.get_state()
+
+            # 每個 frame 只讀一次時鐘；perf_counter 走單調時鐘，
+            # 不受 NTP 校時影響，也比 time.time() 快
+            now = time.perf_counter()
+
+            # 檢查是否碰到起點區域（開始計時）
+            if not self.timing_started:
+                if self._is_in_zone(first_point, self.start_zone):
+                    self.timing_started = True
+                    self.start_time = now
+                    logger.debug("[Game] Player touched start zone! Timer started.")
+                # 還沒碰到起點，不計算碰撞，直接返回
+                return self.get_state()
+
+            # 更新經過時間
+            if self.start_time:
+                self.elapsed_time = now - self.start_time
+
+            # 碰撞偵測
+            was_colliding = self.is_colliding
+            self.is_colliding = min_d2 < self._thr2
+
+            # 新的碰撞事件（有冷卻時間）——無分支版本：
+            # 把「正在碰撞、上一幀沒碰撞、冷卻已過」收成一個 0/1 的 inc，
+            # 計數與時間戳都用算術更新，不走 if 分支
+            cooled_down = now - self.last_collision_time > self.cooldown
+            inc = int(self.is_colliding and not was_colliding and cooled_down)
+            self.collision_count += inc
+            self.last_collision_time = now * inc + self.last_collision_time * (1 - inc)
+
+            # 檢查是否到達終點（用第一個點判斷）
+            if self._is_in_zone(first_point, self.end_zone):
+                self.game_completed = True
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"[Game] Player reached end zone! Final time: {self.elapsed_time:.2f}s, Collisions: {self.collision_count}")
+
+            return self.get_state(min_d2)
+
+    def _min_dist2_to_track(self, points: List[List[float]]) -> float:
         """
-        計算 3D 空間中點到線段的最短距離
-        
-        這是碰撞偵測的核心演算法：
-        1. 將線段視為向量 v = seg_end - seg_start
-        2. 將點到線段起點的向量 w = point - seg_start
-        3. 計算投影參數 t = (w · v) / (v · v)
-        4. t 限制在 [0, 1] 範圍內（確保在線段上）
-        5. 計算最近點並求距離
-        
+        計算多個點到軌道的最短距離平方（NumPy 廣播版本）
+
+        把 P 個點 × N 條線段展開成一個 (P, N) 的距離矩陣，
+        整批算完後取全域最小值：
+        1. W[p,s] = points[p] - A[s]（每個點到每條線段起點的向量）
+        2. 投影參數 t = (W · V) / (V · V)，限制在 [0, 1]
+        3. 最近點向量 = W - t * V，距離取所有組合的最小值
+
+        P 個點和 N 條線段全部在單一 NumPy 廣播中完成，
+        沒有任何逐點或逐線段的 Python 迴圈。
+        回傳的是距離「平方」：碰撞判定只跟閾值平方比大小，
+        開根號延後到 get_state() 回報時才做一次
+
         Args:
-            point: 目標點 [x, y, z]
-            seg_start: 線段起點 [x, y, z]
-            seg_end: 線段終點 [x, y, z]
-        
+            points: 3D 點列表 [[x,y,z], ...]
+
         Returns:
-            float: 點到線段的最短距離
+            float: 所有點之中到軌道的最短距離平方
         """
-        # 轉換為向量計算
-        px, py, pz = point
-        ax, ay, az = seg_start
-        bx, by, bz = seg_end
-        
-        # 線段向量 v = B - A
-        vx = bx - ax
-        vy = by - ay
-        vz = bz - az
-        
-        # 點到起點向量 w = P - A
-        wx = px - ax
-        wy = py - ay
-        wz = pz - az
-        
-        # v · v (線段長度平方)
-        v_dot_v = vx * vx + vy * vy + vz * vz
-        
-        # 處理線段長度為 0 的情況（起點終點重合）
-        if v_dot_v < 1e-10:
-            return math.sqrt(wx * wx + wy * wy + wz * wz)
-        
-        # w · v
-        w_dot_v = wx * vx + wy * vy + wz * vz
-        
-        # 計算投影參數 t，並限制在 [0, 1]
-        t = max(0.0, min(1.0, w_dot_v / v_dot_v))
-        
-        # 線段上最近點 = A + t * v
-        closest_x = ax + t * vx
-        closest_y = ay + t * vy
-        closest_z = az + t * vz
-        
-        # 計算距離
-        dx = px - closest_x
-        dy = py - closest_y
-        dz = pz - closest_z
-        
-        return math.sqrt(dx * dx + dy * dy + dz * dz)
+        # 空列表：零個點的最小值就是無窮大（不可能碰撞）
+        # 也避免 (0,) 形狀的陣列進到核心造成維度錯誤
+        if len(points) == 0:
+            return math.inf
+
+        pts = np.ascontiguousarray(points, dtype=np.float32)  # (P,3)
+
+        # 編譯核心關了邊界檢查，形狀不對的輸入絕不能放進去
+        # （舊版逐分量解包遇到壞輸入也是丟 ValueError）
+        if pts.ndim != 2 or pts.shape[1] != 3:
+            raise ValueError(f"expected (P, 3) points, got shape {pts.shape}")
+
+        # 優先走 Numba 編譯核心（沒裝 numba 時為 None）
+        if _min_dist2_kernel is not None:
+            return float(_min_dist2_kernel(pts, self._A, self._V, self._invvv,
+                                           self._seg_min, self._seg_max))
+
+        # 重用本執行緒的暫存緩衝區（每個 ufunc 都指定 out=），
+        # 第一次使用或點數超過 MAX_POINTS 的罕見情況才配置
+        P = pts.shape[0]
+        n_seg = self._A.shape[0]
+        scratch = self._scratch
+        if P <= MAX_POINTS:
+            if not hasattr(scratch, 'W'):
+                scratch.W = np.empty((MAX_POINTS, n_seg, 3), dtype=np.float32)
+                scratch.t = np.empty((MAX_POINTS, n_seg), dtype=np.float32)
+                scratch.diff = np.empty((MAX_POINTS, n_seg, 3), dtype=np.float32)
+                scratch.d2 = np.empty((MAX_POINTS, n_seg), dtype=np.float32)
+            W, t = scratch.W[:P], scratch.t[:P]
+            diff, d2 = scratch.diff[:P], scratch.d2[:P]
+        else:
+            W = np.empty((P, n_seg, 3), dtype=np.float32)
+            t = np.empty((P, n_seg), dtype=np.float32)
+            diff = np.empty((P, n_seg, 3), dtype=np.float32)
+            d2 = np.empty((P, n_seg), dtype=np.float32)
+
+        # W[p,s] = P[p] - A[s]，廣播成 (P,N,3)
+        np.subtract(pts[:, None, :], self._A[None, :, :], out=W)
+
+        # 投影參數 t = (w · v) * (1 / v · v)，限制在 [0, 1]
+        np.einsum('psi,si->ps', W, self._V, out=t)
+        np.multiply(t, self._invvv, out=t)
+        np.clip(t, 0.0, 1.0, out=t)
+
+        # 每個 (點, 線段) 組合到最近點的向量 = w - t * v
+        np.multiply(t[..., None], self._V, out=diff)
+        np.subtract(W, diff, out=diff)
+
+        np.einsum('psi,psi->ps', diff, diff, out=d2)
+        return float(d2.min())
     
     def _is_in_zone(self, position: List[float], zone_center: List[float]) -> bool:
-        """檢查位置是否在指定區域內"""
+        """檢查位置是否在指定區域內（比較距離平方，免開根號）"""
         dx = position[0] - zone_center[0]
         dy = position[1] - zone_center[1]
         dz = position[2] - zone_center[2]
-        distance = math.sqrt(dx * dx + dy * dy + dz * dz)
-        return distance < self.zone_radius
+        return dx * dx + dy * dy + dz * dz < self._zone_r2
     
     def get_track(self) -> Dict:
         """
         取得軌道資料（供 Unity 渲染用）
-        
+
+        只包含不會變動的幾何資訊，因此可以被永久快取；
+        當前的碰撞閾值由 get_state()（/start、/state 回應）提供
+
         Returns:
             Dict: 包含軌道點、起點、終點等資訊
         """
@@ -275,30 +381,36 @@ class BuzzWireGame:
             "track_points": self.track_points,
             "start_zone": self.start_zone,
             "end_zone": self.end_zone,
-            "zone_radius": self.zone_radius,
-            "collision_threshold": self.collision_threshold
+            "zone_radius": self.zone_radius
         }
     
-    def get_state(self, distance: float = -1.0) -> Dict:
+    def get_state(self, dist2: float = -1.0) -> Dict:
         """
         取得當前遊戲狀態
-        
+
         Args:
-            distance: 當前距離軌道的距離（-1 表示未計算）
-        
+            dist2: 當前距離軌道的距離平方（-1 表示未計算）
+                   開根號只在這裡做一次，用於回報 JSON 欄位
+
         Returns:
             Dict: 遊戲狀態
+
+        註：欄位回傳原始浮點數，不做 round()。
+        round() 每次呼叫約 150 ns，90 Hz 下白白累積；
+        Unity 端解析 JSON 浮點數不在乎多餘的小數位。
+        回傳的是同一個就地更新的 dict，序列化在回傳後立即發生，
+        不會觀察到下一幀的修改（單一 worker）
         """
-        return {
-            "game_started": self.game_started,
-            "game_completed": self.game_completed,
-            "timing_started": self.timing_started,  # 新增
-            "elapsed_time": round(self.elapsed_time, 2),
-            "collision_count": self.collision_count,
-            "is_colliding": self.is_colliding,
-            "distance_to_track": round(distance, 4) if distance >= 0 else -1,
-            "collision_threshold": self.collision_threshold
-        }
+        s = self._state
+        s["game_started"] = self.game_started
+        s["game_completed"] = self.game_completed
+        s["timing_started"] = self.timing_started
+        s["elapsed_time"] = self.elapsed_time
+        s["collision_count"] = self.collision_count
+        s["is_colliding"] = self.is_colliding
+        s["distance_to_track"] = math.sqrt(dist2) if dist2 >= 0 else -1
+        s["collision_threshold"] = self.collision_threshold
+        return s
 
 
 # 測試用
@@ -6,174 +6,238 @@ VR 電流急急棒遊戲伺服器 - 完整版
 1. 接收 Unity VR 端的手把位置
 2. 進行碰撞偵測
 3. 回傳遊戲狀態（是否碰撞、時間、碰撞次數）
+
+使用 FastAPI + uvicorn（ASGI）：
+Werkzeug 開發伺服器是單執行緒 WSGI，90 Hz 的更新頻率下
+每個請求都被 WSGI 開銷吃掉 2-3 ms；換成 ASGI 之後有
+async I/O、orjson 序列化與 Keep-Alive 連線重用
+
+啟動方式：
+    python server.py
+或
+    uvicorn server:app --port 5000
 """
 
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import hashlib
+import logging
+import logging.handlers
+import queue
+from typing import List, Optional
+
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, conlist
 
 # 使用完整版進行測試
 from buzz_wire_game import BuzzWireGame
 # from buzz_wire_game_lab import BuzzWireGame  # 學生版
 
-app = Flask(__name__)
-CORS(app)
+# 日誌：請求路徑上不直接寫 stdout
+# print() 會搶 stdout 鎖並同步 flush，90 Hz 下每次都吃數百微秒；
+# 改用 QueueHandler → QueueListener，格式化與輸出移到背景執行緒
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, logging.StreamHandler())
+_log_listener.start()
+
+logger = logging.getLogger("buzzwire")
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(logging.WARNING)
+
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# 遊戲實例：啟動時建立一次，之後重複使用
+# 避免每次 /start 都重新配置軌道陣列、重新暖機編譯核心
+game = BuzzWireGame()
+
+# 軌道是靜態的（payload 只含幾何，不含可變的碰撞閾值）：
+# 啟動時就序列化成 bytes，/track 直接回傳，
+# 並附上 ETag 讓 Unity 在場景重載時能用 If-None-Match 拿 304
+TRACK_JSON = orjson.dumps(game.get_track())
+TRACK_ETAG = hashlib.blake2b(TRACK_JSON, digest_size=8).hexdigest()
+TRACK_HEADERS = {
+    "ETag": TRACK_ETAG,
+    "Cache-Control": "public, max-age=31536000, immutable",
+}
+
 
-# 遊戲實例
-game = None
+# 3D 點：必須剛好 3 個分量
+# 長度不對的點會被 422 擋下，不會帶著缺分量進到
+# boundscheck(False) 的編譯核心裡越界讀記憶體
+Point3 = conlist(float, min_length=3, max_length=3)
 
 
-@app.route('/start', methods=['POST'])
-def start_game():
+class StartRequest(BaseModel):
+    """POST /start 的請求內容"""
+    collision_threshold: float = 0.05
+
+
+class UpdateRequest(BaseModel):
+    """
+    POST /update 的請求內容
+
+    支援兩種格式：
+    1. 單點：{"position": [x, y, z]}
+    2. 多點：{"positions": [[x,y,z], [x,y,z], ...]}
+    """
+    position: Optional[Point3] = None
+    positions: Optional[List[Point3]] = None
+
+
+class BatchUpdateRequest(BaseModel):
+    """
+    POST /update_batch 的請求內容
+
+    frames：一段時間窗內逐幀的手把位置
+    {"frames": [[x,y,z], [x,y,z], ...]}
+    """
+    frames: List[Point3]
+
+
+@app.post('/start')
+async def start_game(req: Optional[StartRequest] = None):
     """
     開始新遊戲
-    
+
     Returns:
         JSON: 初始遊戲狀態 + 軌道資料
     """
-    global game
-    
-    try:
-        # 取得可選的參數
-        data = request.get_json() or {}
-        threshold = data.get('collision_threshold', 0.05)
-        
-        # 創建新遊戲
-        game = BuzzWireGame(collision_threshold=threshold)
-        game.start_game()
-        
-        # 回傳初始狀態和軌道資料
-        state = game.get_state()
-        track = game.get_track()
-        
-        response = {
-            **state,
-            **track
-        }
-        
-        print(f"[Server] Game started! Threshold: {threshold}")
-        print(f"[Server] Track points count: {len(track.get('track_points', []))}")
-        
-        return jsonify(response)
-    
-    except Exception as e:
-        print(f"[Server] Error in start_game: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route('/update', methods=['POST'])
-def update_game():
+    threshold = req.collision_threshold if req is not None else 0.05
+
+    # 重複使用同一個實例，閾值有變才更新
+    if threshold != game.collision_threshold:
+        game.set_threshold(threshold)
+    game.start_game()
+
+    # 回傳初始狀態和軌道資料
+    state = game.get_state()
+    track = game.get_track()
+
+    logger.debug("[Server] Game started! Threshold: %s", threshold)
+    logger.debug("[Server] Track points count: %d",
+                 len(track.get('track_points', [])))
+
+    return {**state, **track}
+
+
+@app.post('/update')
+async def update_game(req: UpdateRequest):
     """
     更新遊戲狀態
-    
+
     接收手把位置，回傳碰撞偵測結果和遊戲狀態
-    
-    支援兩種格式：
-    1. 單點：{"position": [x, y, z]}
-    2. 多點：{"positions": [[x,y,z], [x,y,z], ...]}
-    
+
     Returns:
         JSON: 遊戲狀態（碰撞、時間、次數等）
     """
-    global game
-    
-    try:
-        if game is None:
-            return jsonify({"error": "Game not started"}), 400
-        
-        # 取得手把位置
-        data = request.get_json()
-        if data is None:
-            return jsonify({"error": "No JSON data received"}), 400
-        
-        # 支援兩種格式：position（單點）或 positions（多點）
-        if 'positions' in data:
-            # 多點格式
-            positions = data.get('positions', [[0, 0, 0]])
-        else:
-            # 單點格式，轉換成多點
-            position = data.get('position', [0, 0, 0])
-            if not isinstance(position, list) or len(position) != 3:
-                position = [0, 0, 0]
-            positions = [position]
-        
-        # 更新遊戲狀態
-        state = game.update(positions)
-        
-        # 如果發生碰撞，輸出提示
-        if state and state.get('is_colliding'):
-            print(f"[Server] COLLISION! Count: {state['collision_count']}, Distance: {state['distance_to_track']}")
-        
-        return jsonify(state)
-    
-    except Exception as e:
-        print(f"[Server] Error in update_game: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route('/track', methods=['GET'])
-def get_track():
+    if not game.game_started:
+        return ORJSONResponse({"error": "Game not started"}, status_code=400)
+
+    # 支援兩種格式：position（單點）或 positions（多點）
+    if req.positions is not None:
+        positions = req.positions
+    else:
+        position = req.position
+        if not isinstance(position, list) or len(position) != 3:
+            position = [0, 0, 0]
+        positions = [position]
+
+    # 更新遊戲狀態
+    state = game.update(positions)
+
+    # 如果發生碰撞，輸出提示
+    # 先檢查等級再組字串，DEBUG 關閉時連格式化成本都不用付
+    if state and state.get('is_colliding') and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"[Server] COLLISION! Count: {state['collision_count']}, Distance: {state['distance_to_track']}")
+
+    # 直接回 ORJSONResponse：跳過 FastAPI 的 jsonable_encoder 走訪，
+    # 讓 orjson 一次把 dict 序列化成 bytes（90 Hz 的熱路徑）
+    return ORJSONResponse(state)
+
+
+@app.post('/update_batch')
+async def update_game_batch(req: BatchUpdateRequest):
+    """
+    批次更新遊戲狀態
+
+    Unity 端可以緩衝數個 frame 的手把位置，一次 POST 上來，
+    把 HTTP 往返成本攤提到多個 frame 上；
+    回傳逐幀的狀態歷史，順序與送進來的 frames 相同
+
+    Returns:
+        JSON: {"states": [每一幀的遊戲狀態, ...]}
+    """
+    if not game.game_started:
+        return ORJSONResponse({"error": "Game not started"}, status_code=400)
+
+    # 逐幀依序跑遊戲邏輯（計時、冷卻、起終點判定都跟逐次 /update 一致）
+    # get_state() 回傳的是同一個就地更新的 dict，所以每幀要複製一份
+    states = [dict(game.update(frame)) for frame in req.frames]
+
+    return ORJSONResponse({"states": states})
+
+
+@app.get('/track')
+async def get_track(request: Request):
     """
     取得軌道資料
-    
+
     Unity 可以用這個 API 來獲取軌道點，進行渲染
-    
+    回應在啟動時就序列化好；客戶端帶 If-None-Match 時直接回 304
+
     Returns:
         JSON: 軌道點列表和相關參數
     """
-    global game
-    
-    if game is None:
-        # 如果遊戲還沒開始，創建一個臨時的來取得軌道
-        temp_game = BuzzWireGame()
-        return jsonify(temp_game.get_track())
-    
-    return jsonify(game.get_track())
+    if request.headers.get('If-None-Match') == TRACK_ETAG:
+        return Response(status_code=304, headers=TRACK_HEADERS)
 
+    return Response(TRACK_JSON, media_type='application/json',
+                    headers=TRACK_HEADERS)
 
-@app.route('/state', methods=['GET'])
-def get_state():
+
+@app.get('/state')
+async def get_state():
     """
     取得當前遊戲狀態
-    
+
     Returns:
         JSON: 當前遊戲狀態
     """
-    global game
-    
-    if game is None:
-        return jsonify({"error": "Game not started"}), 400
-    
-    return jsonify(game.get_state())
+    return game.get_state()
 
 
-@app.route('/reset', methods=['POST'])
-def reset_game():
+@app.post('/reset')
+async def reset_game():
     """
     重置遊戲（不需要重新取得軌道）
-    
+
     Returns:
         JSON: 重置後的遊戲狀態
     """
-    global game
-    
-    if game is None:
-        return jsonify({"error": "Game not started"}), 400
-    
+    # 跟 /update 一樣：第一次 /start 之前不能重置（也不該偷偷開局）
+    if not game.game_started:
+        return ORJSONResponse({"error": "Game not started"}, status_code=400)
+
     game.start_game()
-    return jsonify(game.get_state())
+    return game.get_state()
 
 
-@app.route('/health', methods=['GET'])
-def health_check():
+@app.get('/health')
+async def health_check():
     """健康檢查"""
-    return jsonify({
+    return {
         "status": "ok",
         "message": "VR Buzz Wire Game Server is running!"
-    })
+    }
 
 
 if __name__ == '__main__':
@@ -190,5 +254,5 @@ if __name__ == '__main__':
     print("  POST /reset     - 重置遊戲")
     print("  GET  /health    - 健康檢查")
     print("\n等待 Unity VR 客戶端連接...\n")
-    
-    app.run(host='0.0.0.0', port=5000, debug=True)
+
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,16 @@
+"""
+建置 Cython 距離核心（可選）
+
+    python setup.py build_ext --inplace
+
+建置後 buzz_wire_game.py 會優先使用 _distance 擴充模組；
+沒建置也能跑（退回 Numba 或純 NumPy）。
+"""
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="buzzwire-kernels",
+    ext_modules=cythonize("_distance.pyx"),
+)